@@ -7,36 +7,128 @@ who have all 4 grandparent birth locations in a specified country/region.
 import json
 import os
 import sys
-from collections import defaultdict
-from typing import Dict, List, Any, Optional
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib.colors import to_rgba
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import cycle, islice
+from operator import itemgetter
+from typing import TYPE_CHECKING, Dict, Iterator, List, Any, Optional, Tuple
 
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
 
-def has_all_grandparents_in_location(relative: Dict[str, Any], country_code: str) -> bool:
+# Optional faster JSON backends; the standard library is used when missing
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError already subclasses json.JSONDecodeError
+JSON_ERRORS = (json.JSONDecodeError,) + ((ijson.JSONError,) if ijson else ())
+
+
+def load_relatives(json_file_path: str) -> List[Dict[str, Any]]:
+    """
+    Load all relatives from a 23andMe matches JSON file.
+
+    Args:
+        json_file_path: Path to the 23andMe matches JSON file
+
+    Returns:
+        List of relative dictionaries
+    """
+    if orjson is not None:
+        with open(json_file_path, 'rb') as file:
+            return orjson.loads(file.read())
+
+    with open(json_file_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def iter_relatives(json_file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Iterate over the relatives in a 23andMe matches JSON file.
+
+    Relatives are streamed one at a time when ijson is installed, otherwise
+    the whole file is loaded first.
+
+    Args:
+        json_file_path: Path to the 23andMe matches JSON file
+
+    Yields:
+        Relative dictionaries
+    """
+    if ijson is None:
+        yield from load_relatives(json_file_path)
+        return
+
+    with open(json_file_path, 'rb') as file:
+        yield from ijson.items(file, 'item', use_float=True)
+
+
+# Shared fallback for missing nested objects; never mutated
+_EMPTY = {}
+
+GRANDPARENT_KEYS = ('maternal_gma', 'maternal_gpa', 'paternal_gma', 'paternal_gpa')
+# Fetches all 4 grandparent locations in a single C-level call
+_GET_GRANDPARENTS = itemgetter(*GRANDPARENT_KEYS)
+
+# Haplogroup values that mean "no data"
+INVALID_HAPLOGROUPS = frozenset(('', 'N/A', 'n/a', None))
+
+# Resolution of saved charts; override with the CHART_DPI environment variable
+try:
+    CHART_DPI = int(os.environ.get('CHART_DPI', '150'))
+except ValueError:
+    CHART_DPI = 150
+
+# Number of ancestry levels reported (main, sub and sub-sub categories)
+HIERARCHY_LEVELS = 3
+
+
+def grandparent_countries(relative: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
     """
-    Check if a relative has all 4 grandparent birth locations in the specified country.
+    Get the birth country codes of all 4 grandparents of a relative.
 
     Args:
         relative: Dictionary containing relative information
-        country_code: Two-letter country code (e.g., 'PR', 'US', 'MX')
 
     Returns:
-        bool: True if all 4 grandparents were born in the specified country, False otherwise
+        Tuple of 4 country codes (maternal_gma, maternal_gpa, paternal_gma, paternal_gpa),
+        or None if any grandparent location is missing
+    """
+    try:
+        maternal_gma, maternal_gpa, paternal_gma, paternal_gpa = _GET_GRANDPARENTS(
+            relative.get('grandparent_birth_locations') or _EMPTY)
+    except KeyError:
+        return None
+
+    if not (maternal_gma and maternal_gpa and paternal_gma and paternal_gpa):
+        return None
+
+    return (maternal_gma.get('country'), maternal_gpa.get('country'),
+            paternal_gma.get('country'), paternal_gpa.get('country'))
+
+
+@lru_cache(maxsize=None)
+def format_relationship(relationship_id: str) -> str:
     """
-    gp_locations = relative.get('grandparent_birth_locations', {})
+    Turn a 23andMe relationship id into a display label (e.g. 'half_first_cousin' -> 'Half First Cousin').
 
-    # Check if all 4 grandparent locations exist and are in the specified country
-    required_gps = ['maternal_gma', 'maternal_gpa',
-                    'paternal_gma', 'paternal_gpa']
+    Results are cached, as exports only use a few dozen distinct relationship ids.
 
-    for gp in required_gps:
-        gp_info = gp_locations.get(gp)
-        if not gp_info or gp_info.get('country') != country_code:
-            return False
+    Args:
+        relationship_id: Predicted relationship id
 
-    return True
+    Returns:
+        str: Relationship label
+    """
+    return relationship_id.replace('_', ' ').title()
 
 
 def analyze_haplogroups(relatives: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -49,38 +141,31 @@ def analyze_haplogroups(relatives: List[Dict[str, Any]]) -> Dict[str, Any]:
     Returns:
         Dict containing haplogroup analysis results
     """
-    ydna_counts = defaultdict(int)
-    mtdna_counts = defaultdict(int)
-    ydna_relatives = []
-    mtdna_relatives = []
-
+    # Materialize the (initials, ydna, mtdna, relationship) columns once
+    rows = []
     for relative in relatives:
-        ancestry_data = relative.get('ancestry', {})
-        haplogroups = ancestry_data.get('haplogroups', {})
-
-        # Analyze Y-DNA (paternal line)
-        ydna = haplogroups.get('ydna', '').strip()
-        if ydna and ydna != '' and ydna != 'N/A':
-            ydna_counts[ydna] += 1
-            ydna_relatives.append({
-                'initials': relative.get('initials', 'N/A'),
-                'haplogroup': ydna,
-                'relationship': relative.get('predicted_relationship_id', 'Unknown')
-            })
-
-        # Analyze mtDNA (maternal line)
-        mtdna = haplogroups.get('mtdna', '').strip()
-        if mtdna and mtdna != '' and mtdna != 'N/A':
-            mtdna_counts[mtdna] += 1
-            mtdna_relatives.append({
-                'initials': relative.get('initials', 'N/A'),
-                'haplogroup': mtdna,
-                'relationship': relative.get('predicted_relationship_id', 'Unknown')
-            })
+        haplogroups = (relative.get('ancestry') or _EMPTY).get('haplogroups') or _EMPTY
+        ydna = haplogroups.get('ydna')
+        if ydna is not None:
+            ydna = ydna.strip()
+        mtdna = haplogroups.get('mtdna')
+        if mtdna is not None:
+            mtdna = mtdna.strip()
+        rows.append((relative.get('initials', 'N/A'), ydna, mtdna,
+                     relative.get('predicted_relationship_id', 'Unknown')))
+
+    # Y-DNA (paternal line) and mtDNA (maternal line)
+    ydna_relatives = [{'initials': initials, 'haplogroup': ydna, 'relationship': relationship}
+                      for initials, ydna, _, relationship in rows if ydna not in INVALID_HAPLOGROUPS]
+    mtdna_relatives = [{'initials': initials, 'haplogroup': mtdna, 'relationship': relationship}
+                       for initials, _, mtdna, relationship in rows if mtdna not in INVALID_HAPLOGROUPS]
+
+    ydna_counts = Counter(rel['haplogroup'] for rel in ydna_relatives)
+    mtdna_counts = Counter(rel['haplogroup'] for rel in mtdna_relatives)
 
     return {
-        'ydna_counts': dict(ydna_counts),
-        'mtdna_counts': dict(mtdna_counts),
+        'ydna_counts': ydna_counts,
+        'mtdna_counts': mtdna_counts,
         'ydna_relatives': ydna_relatives,
         'mtdna_relatives': mtdna_relatives,
         'total_ydna': len(ydna_relatives),
@@ -88,73 +173,285 @@ def analyze_haplogroups(relatives: List[Dict[str, Any]]) -> Dict[str, Any]:
     }
 
 
-def extract_ancestry_colors(ancestry_data: Dict[str, Any]) -> Dict[str, str]:
+@dataclass
+class RegionTable:
+    """
+    Registry of every ancestry region seen so far, indexed by stable region ids.
+
+    The nested region schema is compiled into one name lookup per parent the
+    first time it is seen, so later relatives resolve each region with a single
+    dict lookup while walking their tree.
+
+    Attributes:
+        names: Region name per region id
+        parents: Parent region id per region id (-1 for main categories)
+        colors: Actual 23andMe color per region id
+        children: Child region name to region id, per parent region id (-1 for main categories)
+        sums: Running sum of percentages per region id
+        maxes: Running maximum percentage per region id
+    """
+    names: List[str] = field(default_factory=list)
+    parents: List[int] = field(default_factory=list)
+    colors: List[str] = field(default_factory=list)
+    children: Dict[int, Dict[str, int]] = field(default_factory=lambda: {-1: {}})
+    sums: List[float] = field(default_factory=list)
+    maxes: List[float] = field(default_factory=list)
+
+    def add(self, parent_id: int, name: str, color: str) -> int:
+        """
+        Register a new region under a parent region.
+
+        Args:
+            parent_id: Parent region id (-1 for main categories)
+            name: Region name
+            color: Region color
+
+        Returns:
+            int: Id of the new region
+        """
+        region_id = len(self.names)
+        self.names.append(name)
+        self.parents.append(parent_id)
+        self.colors.append(color)
+        self.children[parent_id][name] = region_id
+        self.children[region_id] = {}
+        self.sums.append(0.0)
+        self.maxes.append(0.0)
+        return region_id
+
+
+def walk_ancestry(ancestry_data: Dict[str, Any], regions: RegionTable,
+                  out: Optional[Tuple[List[int], List[float]]] = None) -> Tuple[List[int], List[float]]:
     """
-    Extract colors from ancestry data structure.
+    Flatten the nested ancestry regions of a relative in a single iterative pass.
 
     Args:
         ancestry_data: Dictionary containing ancestry information
+        regions: Region registry; regions not seen before are added to it
+        out: Pair of lists to clear and fill instead of allocating new ones
 
     Returns:
-        Dict mapping ancestry region names to their colors
+        Tuple of parallel lists (region ids, percentages)
     """
-    colors = {}
-
-    def traverse_for_colors(regions_data: Dict[str, List[Dict]]):
-        """Recursively traverse ancestry regions to extract colors."""
-        for main_category, region_list in regions_data.items():
+    if out is None:
+        ids = []
+        percentages = []
+    else:
+        ids, percentages = out
+        ids.clear()
+        percentages.clear()
+    children = regions.children
+
+    # Explicit stack of (regions_data, parent_region_id) instead of recursion
+    stack = [(ancestry_data.get('regions') or _EMPTY, -1)]
+
+    while stack:
+        regions_data, parent_id = stack.pop()
+        lookup = children[parent_id]
+        for region_list in regions_data.values():
             for region in region_list:
-                region_name = region.get('label', '')
-                # Default gray if no color
-                color = region.get('color', '#808080')
+                get = region.get
+                region_name = get('label')
+                if not region_name:
+                    continue
 
-                if region_name:
-                    colors[region_name] = color
+                region_id = lookup.get(region_name)
+                if region_id is None:
+                    # Default gray if no color
+                    region_id = regions.add(parent_id, region_name, get('color', '#808080'))
 
-                # Recursively process sub-regions
-                sub_regions = region.get('regions', {})
+                try:
+                    percent_value = float(get('totalPercent', '0'))
+                except (ValueError, TypeError):
+                    percent_value = 0.0
+
+                ids.append(region_id)
+                percentages.append(percent_value)
+
+                # Queue sub-regions instead of recursing into them
+                sub_regions = get('regions')
                 if sub_regions:
-                    traverse_for_colors(sub_regions)
+                    stack.append((sub_regions, region_id))
+
+    return ids, percentages
+
+
+def accumulate_regions(ids: List[int], percentages: List[float], sums: List[float], maxes: List[float]) -> None:
+    """
+    Add one relative's region percentages into the running sums and maximums.
+
+    Args:
+        ids: Region ids as returned by walk_ancestry()
+        percentages: Region percentages, parallel to ids
+        sums: Running sum per region id, updated in place
+        maxes: Running maximum per region id, updated in place
+    """
+    for region_id, percentage in zip(ids, percentages):
+        sums[region_id] += percentage
+        if percentage > maxes[region_id]:
+            maxes[region_id] = percentage
 
-    # Start traversing from the main regions
-    regions = ancestry_data.get('regions', {})
-    traverse_for_colors(regions)
 
-    return colors
+@dataclass
+class AncestryHierarchy:
+    """
+    Average ancestry hierarchy stored as parallel per-region lists.
 
+    Parents always come before their children, so index order is a valid
+    top-down traversal order.
 
-def build_color_mapping(relatives: List[Dict[str, Any]]) -> Dict[str, str]:
+    Attributes:
+        names: Region name per region
+        avg: Average percentage per region
+        max_: Maximum percentage per region
+        level: Depth per region (0 for main categories)
+        parent: Index of the parent region, or -1 for main categories
+    """
+    names: List[str]
+    avg: List[float]
+    max_: List[float]
+    level: List[int]
+    parent: List[int]
+    # Sort and display order caches, shared by the text output and the charts
+    _sorted_children: Optional[Dict[int, List[int]]] = field(default=None, init=False, repr=False, compare=False)
+    _display_rows: Dict[float, List[int]] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def sorted_children(self) -> Dict[int, List[int]]:
+        """
+        Group region indices by parent, each group sorted by average percentage (descending).
+
+        The result is computed once and cached; the hierarchy must not be changed afterwards.
+
+        Returns:
+            Dict mapping parent index (-1 for main categories) to child region indices
+        """
+        if self._sorted_children is None:
+            children = {-1: []}
+            for idx in sorted(range(len(self.names)), key=self.avg.__getitem__, reverse=True):
+                children.setdefault(self.parent[idx], []).append(idx)
+            self._sorted_children = children
+        return self._sorted_children
+
+    def display_rows(self, min_percentage: float = 0.1) -> List[int]:
+        """
+        List region indices in display order (depth-first, highest average first).
+
+        Rows are cached per min_percentage; callers must not modify the returned list.
+
+        Args:
+            min_percentage: Regions with an average at or below this are skipped,
+                together with their sub-regions
+
+        Returns:
+            List of region indices
+        """
+        rows = self._display_rows.get(min_percentage)
+        if rows is not None:
+            return rows
+
+        children = self.sorted_children()
+        rows = []
+        stack = children[-1][::-1]
+
+        while stack:
+            idx = stack.pop()
+            if self.avg[idx] > min_percentage:
+                rows.append(idx)
+                stack.extend(reversed(children.get(idx, [])))
+
+        self._display_rows[min_percentage] = rows
+        return rows
+
+
+def build_average_hierarchy(regions: RegionTable, num_relatives: int) -> AncestryHierarchy:
     """
-    Build a comprehensive color mapping from all relatives' ancestry data.
+    Build the average ancestry hierarchy from the accumulated region tables.
 
     Args:
-        relatives: List of relative dictionaries
+        regions: Region registry with accumulated sums and maximums
+        num_relatives: Number of relatives the sums were accumulated over
 
     Returns:
-        Dict mapping ancestry region names to colors
+        AncestryHierarchy limited to the main, sub and sub-sub categories
     """
-    all_colors = {}
+    hierarchy = AncestryHierarchy([], [], [], [], [])
+    # Region id to hierarchy index, None for regions below the reported levels
+    region_rows = []
+    # Multiply by the reciprocal instead of dividing per region
+    inv_n = 1.0 / num_relatives
+
+    for region_id, (region_name, parent_id) in enumerate(zip(regions.names, regions.parents)):
+        if parent_id >= 0:
+            parent_row = region_rows[parent_id]
+            level = hierarchy.level[parent_row] + 1 if parent_row is not None else HIERARCHY_LEVELS
+        else:
+            parent_row = -1
+            level = 0
 
-    for relative in relatives:
-        ancestry_data = relative.get('ancestry', {})
-        if ancestry_data:
-            relative_colors = extract_ancestry_colors(ancestry_data)
-            all_colors.update(relative_colors)
+        if level >= HIERARCHY_LEVELS:
+            region_rows.append(None)
+            continue
+
+        region_rows.append(len(hierarchy.names))
+        hierarchy.names.append(region_name)
+        hierarchy.avg.append(regions.sums[region_id] * inv_n)
+        hierarchy.max_.append(regions.maxes[region_id])
+        hierarchy.level.append(level)
+        hierarchy.parent.append(parent_row)
+
+    return hierarchy
+
+
+def import_pyplot():
+    """
+    Import matplotlib's pyplot on first use.
+
+    Matplotlib is only needed for charts, so it is not imported at module load.
+    Charts are only written to files, so the non-interactive Agg backend is used.
+
+    Returns:
+        The matplotlib.pyplot module
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def prepare_figure(fig: Optional['Figure'], figsize: Tuple[float, float]) -> Tuple['Figure', Any]:
+    """
+    Get a blank figure with a single axes for a new chart.
 
-    return all_colors
+    Args:
+        fig: Figure to clear and reuse, or None to create a new one
+        figsize: Figure size in inches (width, height)
+
+    Returns:
+        Tuple of (figure, axes)
+    """
+    if fig is None:
+        fig = import_pyplot().figure(figsize=figsize)
+    else:
+        fig.clear()
+        fig.set_size_inches(figsize)
+
+    return fig, fig.add_subplot(111)
 
 
-def create_haplogroup_charts(haplogroup_data: Dict[str, Any], location_label: str) -> List[str]:
+def create_haplogroup_charts(haplogroup_data: Dict[str, Any], location_label: str, slug: str, fig: Optional['Figure'] = None) -> List[str]:
     """
     Create bar charts for haplogroup distributions.
 
     Args:
         haplogroup_data: Results from analyze_haplogroups()
         location_label: Label for the location (e.g., 'Puerto Rico', 'Mexico')
+        slug: Filename prefix for the location (e.g., 'puerto_rico')
+        fig: Figure to reuse for drawing, or None to use a new figure per chart
 
     Returns:
         List of filenames of saved charts
     """
+    plt = import_pyplot()
     chart_files = []
 
     # Y-DNA Chart
@@ -171,25 +468,25 @@ def create_haplogroup_charts(haplogroup_data: Dict[str, Any], location_label: st
         ydna_counts.reverse()
         # Dynamically set figure height
         fig_height = max(8, 0.5 * len(ydna_groups))
-        plt.figure(figsize=(12, fig_height))
-        bars = plt.barh(ydna_groups, ydna_counts,
-                        color=ydna_colors * ((len(ydna_groups) // len(ydna_colors)) + 1))
+        chart_fig, ax = prepare_figure(fig, (12, fig_height))
+        bars = ax.barh(ydna_groups, ydna_counts,
+                        color=list(islice(cycle(ydna_colors), len(ydna_groups))))
         # Add count labels
-        for bar, count in zip(bars, ydna_counts):
-            plt.text(bar.get_width() + 0.1, bar.get_y() + bar.get_height()/2,
-                     f'{count}', va='center', fontweight='bold')
-        plt.xlabel('Number of Relatives', fontsize=12, fontweight='bold')
-        plt.title(f'Y-DNA Haplogroup Distribution\nRelatives with 4 Grandparents Born in {location_label} (n={haplogroup_data["total_ydna"]})',
-                  fontsize=14, fontweight='bold', pad=20)
+        ax.bar_label(bars, labels=[f'{count}' for count in ydna_counts],
+                     padding=3, fontweight='bold')
+        ax.set_xlabel('Number of Relatives', fontsize=12, fontweight='bold')
+        ax.set_title(f'Y-DNA Haplogroup Distribution\nRelatives with 4 Grandparents Born in {location_label} (n={haplogroup_data["total_ydna"]})',
+                     fontsize=14, fontweight='bold', pad=20)
         # Customize appearance
-        plt.gca().spines['top'].set_visible(False)
-        plt.gca().spines['right'].set_visible(False)
-        plt.gca().spines['left'].set_visible(False)
-        plt.grid(axis='x', alpha=0.3, linestyle='--')
-        plt.tight_layout()
-        ydna_filename = f'{location_label.lower().replace(" ", "_")}_ydna_haplogroups.png'
-        plt.savefig(ydna_filename, dpi=300, bbox_inches='tight')
-        plt.close()
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.spines['left'].set_visible(False)
+        ax.grid(axis='x', alpha=0.3, linestyle='--')
+        chart_fig.tight_layout()
+        ydna_filename = f'{slug}_ydna_haplogroups.png'
+        chart_fig.savefig(ydna_filename, dpi=CHART_DPI)
+        if fig is None:
+            plt.close(chart_fig)
         chart_files.append(ydna_filename)
 
     # mtDNA Chart
@@ -208,25 +505,25 @@ def create_haplogroup_charts(haplogroup_data: Dict[str, Any], location_label: st
         mtdna_counts.reverse()
         # Dynamically set figure height
         fig_height = max(10, 0.5 * len(mtdna_groups))
-        plt.figure(figsize=(12, fig_height))
-        bars = plt.barh(mtdna_groups, mtdna_counts,
-                        color=mtdna_colors * ((len(mtdna_groups) // len(mtdna_colors)) + 1))
+        chart_fig, ax = prepare_figure(fig, (12, fig_height))
+        bars = ax.barh(mtdna_groups, mtdna_counts,
+                        color=list(islice(cycle(mtdna_colors), len(mtdna_groups))))
         # Add count labels
-        for bar, count in zip(bars, mtdna_counts):
-            plt.text(bar.get_width() + 0.1, bar.get_y() + bar.get_height()/2,
-                     f'{count}', va='center', fontweight='bold')
-        plt.xlabel('Number of Relatives', fontsize=12, fontweight='bold')
-        plt.title(f'mtDNA Haplogroup Distribution\nRelatives with 4 Grandparents Born in {location_label} (n={haplogroup_data["total_mtdna"]})',
-                  fontsize=14, fontweight='bold', pad=20)
+        ax.bar_label(bars, labels=[f'{count}' for count in mtdna_counts],
+                     padding=3, fontweight='bold')
+        ax.set_xlabel('Number of Relatives', fontsize=12, fontweight='bold')
+        ax.set_title(f'mtDNA Haplogroup Distribution\nRelatives with 4 Grandparents Born in {location_label} (n={haplogroup_data["total_mtdna"]})',
+                     fontsize=14, fontweight='bold', pad=20)
         # Customize appearance
-        plt.gca().spines['top'].set_visible(False)
-        plt.gca().spines['right'].set_visible(False)
-        plt.gca().spines['left'].set_visible(False)
-        plt.grid(axis='x', alpha=0.3, linestyle='--')
-        plt.tight_layout()
-        mtdna_filename = f'{location_label.lower().replace(" ", "_")}_mtdna_haplogroups.png'
-        plt.savefig(mtdna_filename, dpi=300, bbox_inches='tight')
-        plt.close()
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.spines['left'].set_visible(False)
+        ax.grid(axis='x', alpha=0.3, linestyle='--')
+        chart_fig.tight_layout()
+        mtdna_filename = f'{slug}_mtdna_haplogroups.png'
+        chart_fig.savefig(mtdna_filename, dpi=CHART_DPI)
+        if fig is None:
+            plt.close(chart_fig)
         chart_files.append(mtdna_filename)
 
     return chart_files
@@ -241,22 +538,14 @@ def display_haplogroup_analysis(haplogroup_data: Dict[str, Any], total_relatives
         total_relatives: Total number of relatives analyzed
         output_lines: List to append output lines to
     """
-    print("\n" + "="*60)
-    print("HAPLOGROUP ANALYSIS")
-    print("="*60)
-    output_lines.append("\n" + "="*60)
-    output_lines.append("HAPLOGROUP ANALYSIS")
-    output_lines.append("="*60)
+    # Lines are collected and written to stdout in one go at the end
+    local_lines = ["\n" + "="*60, "HAPLOGROUP ANALYSIS", "="*60]
 
     # Y-DNA Analysis
-    print(f"\n🧬 Y-DNA HAPLOGROUPS (Paternal Line)")
-    print(
+    local_lines.append(f"\n🧬 Y-DNA HAPLOGROUPS (Paternal Line)")
+    local_lines.append(
         f"Available data: {haplogroup_data['total_ydna']}/{total_relatives} relatives")
-    print("-" * 40)
-    output_lines.append(f"\n🧬 Y-DNA HAPLOGROUPS (Paternal Line)")
-    output_lines.append(
-        f"Available data: {haplogroup_data['total_ydna']}/{total_relatives} relatives")
-    output_lines.append("-" * 40)
+    local_lines.append("-" * 40)
 
     # Sort Y-DNA by frequency
     sorted_ydna = sorted(
@@ -266,45 +555,35 @@ def display_haplogroup_analysis(haplogroup_data: Dict[str, Any], total_relatives
         for haplogroup, count in sorted_ydna:
             percentage = (count / haplogroup_data['total_ydna']) * 100
             line = f"{haplogroup:<15} {count:>3} relatives ({percentage:>5.1f}%)"
-            print(line)
-            output_lines.append(line)
+            local_lines.append(line)
 
         # Show most common Y-DNA details
         if sorted_ydna:
             most_common_ydna = sorted_ydna[0][0]
-            print(f"\nMost common Y-DNA: {most_common_ydna}")
-            output_lines.append(f"\nMost common Y-DNA: {most_common_ydna}")
+            local_lines.append(f"\nMost common Y-DNA: {most_common_ydna}")
 
             # Show relatives with this haplogroup
             matching_relatives = [
                 r for r in haplogroup_data['ydna_relatives'] if r['haplogroup'] == most_common_ydna]
             if len(matching_relatives) <= 5:
                 for rel in matching_relatives:
-                    rel_line = f"  • {rel['initials']} ({rel['relationship'].replace('_', ' ').title()})"
-                    print(rel_line)
-                    output_lines.append(rel_line)
+                    rel_line = f"  • {rel['initials']} ({format_relationship(rel['relationship'])})"
+                    local_lines.append(rel_line)
             else:
                 for rel in matching_relatives[:3]:
-                    rel_line = f"  • {rel['initials']} ({rel['relationship'].replace('_', ' ').title()})"
-                    print(rel_line)
-                    output_lines.append(rel_line)
+                    rel_line = f"  • {rel['initials']} ({format_relationship(rel['relationship'])})"
+                    local_lines.append(rel_line)
                 more_line = f"  • ... and {len(matching_relatives) - 3} more"
-                print(more_line)
-                output_lines.append(more_line)
+                local_lines.append(more_line)
     else:
         no_data_line = "No Y-DNA data available"
-        print(no_data_line)
-        output_lines.append(no_data_line)
+        local_lines.append(no_data_line)
 
     # mtDNA Analysis
-    print(f"\n🧬 mtDNA HAPLOGROUPS (Maternal Line)")
-    print(
-        f"Available data: {haplogroup_data['total_mtdna']}/{total_relatives} relatives")
-    print("-" * 40)
-    output_lines.append(f"\n🧬 mtDNA HAPLOGROUPS (Maternal Line)")
-    output_lines.append(
+    local_lines.append(f"\n🧬 mtDNA HAPLOGROUPS (Maternal Line)")
+    local_lines.append(
         f"Available data: {haplogroup_data['total_mtdna']}/{total_relatives} relatives")
-    output_lines.append("-" * 40)
+    local_lines.append("-" * 40)
 
     # Sort mtDNA by frequency
     sorted_mtdna = sorted(
@@ -314,127 +593,42 @@ def display_haplogroup_analysis(haplogroup_data: Dict[str, Any], total_relatives
         for haplogroup, count in sorted_mtdna:
             percentage = (count / haplogroup_data['total_mtdna']) * 100
             line = f"{haplogroup:<15} {count:>3} relatives ({percentage:>5.1f}%)"
-            print(line)
-            output_lines.append(line)
+            local_lines.append(line)
 
         # Show most common mtDNA details
         if sorted_mtdna:
             most_common_mtdna = sorted_mtdna[0][0]
-            print(f"\nMost common mtDNA: {most_common_mtdna}")
-            output_lines.append(f"\nMost common mtDNA: {most_common_mtdna}")
+            local_lines.append(f"\nMost common mtDNA: {most_common_mtdna}")
 
             # Show relatives with this haplogroup
             matching_relatives = [
                 r for r in haplogroup_data['mtdna_relatives'] if r['haplogroup'] == most_common_mtdna]
             if len(matching_relatives) <= 5:
                 for rel in matching_relatives:
-                    rel_line = f"  • {rel['initials']} ({rel['relationship'].replace('_', ' ').title()})"
-                    print(rel_line)
-                    output_lines.append(rel_line)
+                    rel_line = f"  • {rel['initials']} ({format_relationship(rel['relationship'])})"
+                    local_lines.append(rel_line)
             else:
                 for rel in matching_relatives[:3]:
-                    rel_line = f"  • {rel['initials']} ({rel['relationship'].replace('_', ' ').title()})"
-                    print(rel_line)
-                    output_lines.append(rel_line)
+                    rel_line = f"  • {rel['initials']} ({format_relationship(rel['relationship'])})"
+                    local_lines.append(rel_line)
                 more_line = f"  • ... and {len(matching_relatives) - 3} more"
-                print(more_line)
-                output_lines.append(more_line)
+                local_lines.append(more_line)
     else:
         no_data_line = "No mtDNA data available"
-        print(no_data_line)
-        output_lines.append(no_data_line)
-
-
-def extract_ancestry_percentages(ancestry_data: Dict[str, Any]) -> Dict[str, float]:
-    """
-    Extract ancestry percentages from the nested ancestry structure.
-
-    Args:
-        ancestry_data: Dictionary containing ancestry information
-
-    Returns:
-        Dict mapping ancestry region names to percentages
-    """
-    percentages = {}
-
-    def traverse_regions(regions_data: Dict[str, List[Dict]], prefix: str = ""):
-        """Recursively traverse ancestry regions to extract percentages."""
-        for main_category, region_list in regions_data.items():
-            for region in region_list:
-                region_name = region.get('label', '')
-                total_percent = region.get('totalPercent', '0')
-
-                # Convert percentage string to float
-                try:
-                    percent_value = float(total_percent)
-                    full_name = f"{prefix}{region_name}" if prefix else region_name
-                    percentages[full_name] = percent_value
-                except (ValueError, TypeError):
-                    continue
-
-                # Recursively process sub-regions
-                sub_regions = region.get('regions', {})
-                if sub_regions:
-                    sub_prefix = f"{region_name} > " if region_name else ""
-                    traverse_regions(sub_regions, sub_prefix)
-
-    # Start traversing from the main regions
-    regions = ancestry_data.get('regions', {})
-    traverse_regions(regions)
+        local_lines.append(no_data_line)
 
-    return percentages
+    sys.stdout.write('\n'.join(local_lines) + '\n')
+    output_lines.extend(local_lines)
 
 
-def organize_ancestry_hierarchically(ancestry_data: Dict[str, Any]) -> Dict[str, Any]:
+def display_hierarchy(hierarchy: AncestryHierarchy, output_lines: List[str] = None) -> List[str]:
     """
-    Organize ancestry data in a hierarchical structure for better display.
+    Format ancestry hierarchy in a tree-like format with avg and max percentages.
 
-    Args:
-        ancestry_data: Dictionary containing ancestry information
-
-    Returns:
-        Dict with hierarchical ancestry structure
-    """
-    hierarchy = {}
-
-    def build_hierarchy(regions_data: Dict[str, List[Dict]], parent_dict: Dict):
-        """Recursively build hierarchy from ancestry regions."""
-        for main_category, region_list in regions_data.items():
-            for region in region_list:
-                region_name = region.get('label', '')
-                total_percent = region.get('totalPercent', '0')
-
-                try:
-                    percent_value = float(total_percent)
-                except (ValueError, TypeError):
-                    percent_value = 0.0
-
-                if region_name:
-                    parent_dict[region_name] = {
-                        'percentage': percent_value,
-                        'children': {}
-                    }
-
-                    # Recursively process sub-regions
-                    sub_regions = region.get('regions', {})
-                    if sub_regions:
-                        build_hierarchy(
-                            sub_regions, parent_dict[region_name]['children'])
-
-    # Start building from the main regions
-    regions = ancestry_data.get('regions', {})
-    build_hierarchy(regions, hierarchy)
-
-    return hierarchy
-
-
-def display_hierarchy(hierarchy: Dict[str, Any], indent: int = 0, output_lines: List[str] = None) -> List[str]:
-    """
-    Display ancestry hierarchy in a tree-like format with avg and max percentages.
+    Lines are not printed; the caller writes them out in one go.
 
     Args:
-        hierarchy: Hierarchical ancestry data
-        indent: Current indentation level
+        hierarchy: Average ancestry hierarchy
         output_lines: List to collect output lines
 
     Returns:
@@ -443,62 +637,57 @@ def display_hierarchy(hierarchy: Dict[str, Any], indent: int = 0, output_lines:
     if output_lines is None:
         output_lines = []
 
-    # Sort by percentage (descending)
-    sorted_items = sorted(
-        hierarchy.items(), key=lambda x: x[1]['percentage'], reverse=True)
-
-    for region_name, data in sorted_items:
-        percentage = data['percentage']
-        max_percentage = data.get('max_percentage', percentage)
-
-        if percentage > 0.1:  # Only show regions with > 0.1%
-            prefix = "  " * indent
-            if indent == 0:
-                # Main categories
-                line = f"{prefix}● {region_name:<40} avg: {percentage:>5.1f}%  max: {max_percentage:>5.1f}%"
-            elif indent == 1:
-                # Sub-categories
-                line = f"{prefix}├─ {region_name:<37} avg: {percentage:>5.1f}%  max: {max_percentage:>5.1f}%"
-            else:
-                # Sub-sub-categories
-                line = f"{prefix}└─ {region_name:<34} avg: {percentage:>5.1f}%  max: {max_percentage:>5.1f}%"
-
-            print(line)
-            output_lines.append(line)
+    # Only regions with > 0.1% are shown
+    for idx in hierarchy.display_rows():
+        region_name = hierarchy.names[idx]
+        percentage = hierarchy.avg[idx]
+        max_percentage = hierarchy.max_[idx]
+        indent = hierarchy.level[idx]
+
+        prefix = "  " * indent
+        if indent == 0:
+            # Main categories
+            line = f"{prefix}● {region_name:<40} avg: {percentage:>5.1f}%  max: {max_percentage:>5.1f}%"
+        elif indent == 1:
+            # Sub-categories
+            line = f"{prefix}├─ {region_name:<37} avg: {percentage:>5.1f}%  max: {max_percentage:>5.1f}%"
+        else:
+            # Sub-sub-categories
+            line = f"{prefix}└─ {region_name:<34} avg: {percentage:>5.1f}%  max: {max_percentage:>5.1f}%"
 
-            # Recursively display children
-            children = data.get('children', {})
-            if children:
-                display_hierarchy(children, indent + 1, output_lines)
+        output_lines.append(line)
 
     return output_lines
 
 
-def create_main_categories_bar_chart(hierarchy: Dict[str, Any], num_relatives: int, color_mapping: Dict[str, str], location_label: str) -> str:
+def create_main_categories_bar_chart(hierarchy: AncestryHierarchy, num_relatives: int, color_mapping: Dict[str, str], location_label: str, slug: str, fig: Optional['Figure'] = None) -> str:
     """
     Create a bar chart for main ancestry categories showing avg and max using actual 23andMe colors.
 
     Args:
-        hierarchy: Hierarchical ancestry data
+        hierarchy: Average ancestry hierarchy
         num_relatives: Number of relatives in the analysis
         color_mapping: Mapping of region names to their actual colors
+        location_label: Label for the location (e.g., 'Puerto Rico', 'Mexico')
+        slug: Filename prefix for the location (e.g., 'puerto_rico')
+        fig: Figure to reuse for drawing, or None to create a new one
 
     Returns:
         str: Filename of the saved chart
     """
+    plt = import_pyplot()
+
     # Extract main categories and their percentages
     categories = []
     avg_percentages = []
     max_percentages = []
     chart_colors = []
 
-    # Sort by percentage (descending) and reverse for top-to-bottom display
-    sorted_items = sorted(
-        hierarchy.items(), key=lambda x: x[1]['percentage'], reverse=True)
-
-    for i, (region_name, data) in enumerate(sorted_items):
-        avg_percentage = data['percentage']
-        max_percentage = data.get('max_percentage', avg_percentage)
+    # Main categories sorted by percentage (descending), reversed below for top-to-bottom display
+    for idx in hierarchy.sorted_children()[-1]:
+        region_name = hierarchy.names[idx]
+        avg_percentage = hierarchy.avg[idx]
+        max_percentage = hierarchy.max_[idx]
         if avg_percentage > 0.5:  # Only show categories with > 0.5%
             categories.append(region_name)
             avg_percentages.append(avg_percentage)
@@ -513,7 +702,7 @@ def create_main_categories_bar_chart(hierarchy: Dict[str, Any], num_relatives: i
     chart_colors.reverse()
 
     # Create the figure with grouped bars
-    fig, ax = plt.subplots(figsize=(14, 8))
+    chart_fig, ax = prepare_figure(fig, (14, 8))
 
     # Set up positions for grouped bars
     y_pos = range(len(categories))
@@ -526,13 +715,10 @@ def create_main_categories_bar_chart(hierarchy: Dict[str, Any], num_relatives: i
                        bar_height, label='Maximum', color=chart_colors, alpha=0.5)
 
     # Add percentage labels
-    for bar, percentage in zip(bars_avg, avg_percentages):
-        ax.text(bar.get_width() + 0.5, bar.get_y() + bar.get_height()/2,
-                f'{percentage:.1f}%', va='center', fontweight='bold', fontsize=9)
-
-    for bar, percentage in zip(bars_max, max_percentages):
-        ax.text(bar.get_width() + 0.5, bar.get_y() + bar.get_height()/2,
-                f'{percentage:.1f}%', va='center', fontsize=9, style='italic')
+    ax.bar_label(bars_avg, labels=[f'{percentage:.1f}%' for percentage in avg_percentages],
+                 padding=3, fontweight='bold', fontsize=9)
+    ax.bar_label(bars_max, labels=[f'{percentage:.1f}%' for percentage in max_percentages],
+                 padding=3, fontsize=9, style='italic')
 
     # Customize appearance
     ax.set_yticks(y_pos)
@@ -545,97 +731,89 @@ def create_main_categories_bar_chart(hierarchy: Dict[str, Any], num_relatives: i
     ax.spines['right'].set_visible(False)
     ax.spines['left'].set_visible(False)
     ax.grid(axis='x', alpha=0.3, linestyle='--')
-    plt.tight_layout()
+    chart_fig.tight_layout()
 
     # Save the chart
-    filename = f'{location_label.lower().replace(" ", "_")}_ancestry_main_categories.png'
-    plt.savefig(filename, dpi=300, bbox_inches='tight')
-    plt.close()
+    filename = f'{slug}_ancestry_main_categories.png'
+    chart_fig.savefig(filename, dpi=CHART_DPI)
+    if fig is None:
+        plt.close(chart_fig)
 
     return filename
 
 
-def create_detailed_ancestry_chart(hierarchy: Dict[str, Any], num_relatives: int, color_mapping: Dict[str, str], location_label: str) -> str:
+def create_detailed_ancestry_chart(hierarchy: AncestryHierarchy, num_relatives: int, color_mapping: Dict[str, str], location_label: str, slug: str, fig: Optional['Figure'] = None) -> str:
     """
     Create a detailed hierarchical chart showing all subcategories with avg and max using actual 23andMe colors.
 
     Args:
-        hierarchy: Hierarchical ancestry data
+        hierarchy: Average ancestry hierarchy
         num_relatives: Number of relatives in the analysis
         color_mapping: Mapping of region names to their actual colors
+        location_label: Label for the location (e.g., 'Puerto Rico', 'Mexico')
+        slug: Filename prefix for the location (e.g., 'puerto_rico')
+        fig: Figure to reuse for drawing, or None to create a new one
 
     Returns:
         str: Filename of the saved chart
     """
-    # First, count total items to determine appropriate figure size
-    def count_items(hier_dict, level=0):
-        count = 0
-        sorted_items = sorted(hier_dict.items(), key=lambda x: x[1]['percentage'], reverse=True)
-        for item_name, item_data in sorted_items:
-            if item_data['percentage'] > 0.1:
-                count += 1
-                children = item_data.get('children', {})
-                if children:
-                    count += count_items(children, level + 1)
-        return count
-
-    total_items_count = count_items(hierarchy)
+    plt = import_pyplot()
+    from matplotlib.colors import to_rgba
+    from matplotlib.patches import Patch
+
+    # Rows in hierarchical order (matching text output exactly)
+    display_rows = hierarchy.display_rows()
+    total_items_count = len(display_rows)
 
     # Dynamically set figure height based on number of items (0.4 inches per item, minimum 12)
     fig_height = max(12, total_items_count * 0.4)
-    fig, ax = plt.subplots(figsize=(20, fig_height))
+    chart_fig, ax = prepare_figure(fig, (20, fig_height))
 
-    # Collect all items in hierarchical order (matching text output exactly)
+    # Collect all items under main categories above 0.5%
     all_items = []
-
-    def add_hierarchy_items(hier_dict, level=0, parent_color='#808080'):
-        """Recursively add all hierarchy items."""
-        sorted_items = sorted(
-            hier_dict.items(), key=lambda x: x[1]['percentage'], reverse=True)
-
-        for item_name, item_data in sorted_items:
-            avg_percentage = item_data['percentage']
-            max_percentage = item_data.get('max_percentage', avg_percentage)
-
-            # Show all items above 0.1% threshold (matching text output)
-            if avg_percentage > 0.1:
-                # Use actual color from mapping, fallback to parent color
-                item_color = color_mapping.get(item_name, parent_color)
-
-                all_items.append({
-                    'level': level,
-                    'name': item_name,
-                    'avg_percentage': avg_percentage,
-                    'max_percentage': max_percentage,
-                    'color': item_color
-                })
-
-                # Recursively add children
-                children = item_data.get('children', {})
-                if children:
-                    add_hierarchy_items(children, level + 1, item_color)
-
-    # Sort main categories by percentage
-    sorted_main = sorted(
-        hierarchy.items(), key=lambda x: x[1]['percentage'], reverse=True)
-    main_hierarchy = {name: data for name,
-                      data in sorted_main if data['percentage'] > 0.5}
-
-    # Add all hierarchy items
-    add_hierarchy_items(main_hierarchy)
+    item_colors = {}
+    include_main = False
+
+    for idx in display_rows:
+        level = hierarchy.level[idx]
+        if level == 0:
+            include_main = hierarchy.avg[idx] > 0.5
+        if not include_main:
+            continue
+
+        # Use actual color from mapping, fallback to parent color
+        item_color = color_mapping.get(hierarchy.names[idx], item_colors.get(hierarchy.parent[idx], '#808080'))
+        item_colors[idx] = item_color
+
+        all_items.append({
+            'level': level,
+            'name': hierarchy.names[idx],
+            'avg_percentage': hierarchy.avg[idx],
+            'max_percentage': hierarchy.max_[idx],
+            'color': item_color
+        })
 
     # Calculate total height needed and assign positions from top to bottom
     total_items = len(all_items)
     y_positions = []
     labels = []
 
+    # Dynamically adjust sizes based on total items
+    base_font_size = max(7, min(10, 200 / total_items))  # Scale down font for many items
+
+    # Per-bar geometry and label styling, drawn in one call per bar series below
+    avg_y = []
+    max_y = []
+    bar_heights = []
+    avg_colors = []
+    max_colors = []
+    font_weights = []
+    font_sizes = []
+
     for i, item in enumerate(all_items):
         y_pos = total_items - i - 1  # Reverse the order for top-to-bottom
         level = item['level']
 
-        # Dynamically adjust sizes based on total items
-        base_font_size = max(7, min(10, 200 / total_items))  # Scale down font for many items
-
         # Determine bar height and alpha based on level
         if level == 0:  # Main category
             bar_height = 0.7
@@ -643,7 +821,6 @@ def create_detailed_ancestry_chart(hierarchy: Dict[str, Any], num_relatives: int
             alpha_max = 0.5
             font_weight = 'bold'
             font_size = base_font_size + 1
-            label_font_size = base_font_size + 1
             prefix = "● "
         elif level == 1:  # Sub-category
             bar_height = 0.55
@@ -651,7 +828,6 @@ def create_detailed_ancestry_chart(hierarchy: Dict[str, Any], num_relatives: int
             alpha_max = 0.4
             font_weight = 'normal'
             font_size = base_font_size
-            label_font_size = base_font_size
             prefix = "  ├─ "
         else:  # Sub-sub-category
             bar_height = 0.45
@@ -659,31 +835,40 @@ def create_detailed_ancestry_chart(hierarchy: Dict[str, Any], num_relatives: int
             alpha_max = 0.3
             font_weight = 'normal'
             font_size = base_font_size - 0.5
-            label_font_size = base_font_size - 0.5
             prefix = "    └─ "
 
-        # Draw bars for avg and max with better spacing (avg on top, max on bottom)
-        ax.barh(y_pos + bar_height/3, item['avg_percentage'], color=item['color'],
-                height=bar_height/2, alpha=alpha_avg)
-        ax.barh(y_pos - bar_height/3, item['max_percentage'], color=item['color'],
-                height=bar_height/2, alpha=alpha_max)
-
-        # Add percentage labels with better positioning (avg on top, max on bottom)
-        label_offset = max(1.5, item['avg_percentage'] * 0.02)
-        ax.text(item['avg_percentage'] + label_offset, y_pos + bar_height/3,
-                f"{item['avg_percentage']:.1f}%",
-                va='center', fontweight=font_weight, fontsize=font_size,
-                bbox=dict(boxstyle='round,pad=0.3', facecolor='white', edgecolor='none', alpha=0.7))
-        ax.text(item['max_percentage'] + label_offset, y_pos - bar_height/3,
-                f"{item['max_percentage']:.1f}%",
-                va='center', fontsize=font_size-0.5, style='italic', alpha=0.9,
-                bbox=dict(boxstyle='round,pad=0.3', facecolor='white', edgecolor='none', alpha=0.5))
+        # Avg on top, max on bottom; alpha is folded into each bar's color
+        avg_y.append(y_pos + bar_height/3)
+        max_y.append(y_pos - bar_height/3)
+        bar_heights.append(bar_height/2)
+        avg_colors.append(to_rgba(item['color'], alpha_avg))
+        max_colors.append(to_rgba(item['color'], alpha_max))
+        font_weights.append(font_weight)
+        font_sizes.append(font_size)
 
         y_positions.append(y_pos)
 
         # Create label with appropriate indentation
         labels.append(f"{prefix}{item['name']}")
 
+    # Draw bars for avg and max
+    bars_avg = ax.barh(avg_y, [item['avg_percentage'] for item in all_items],
+                       height=bar_heights, color=avg_colors)
+    bars_max = ax.barh(max_y, [item['max_percentage'] for item in all_items],
+                       height=bar_heights, color=max_colors)
+
+    # Add percentage labels
+    avg_texts = ax.bar_label(bars_avg, labels=[f"{item['avg_percentage']:.1f}%" for item in all_items],
+                             padding=6,
+                             bbox=dict(boxstyle='round,pad=0.3', facecolor='white', edgecolor='none', alpha=0.7))
+    max_texts = ax.bar_label(bars_max, labels=[f"{item['max_percentage']:.1f}%" for item in all_items],
+                             padding=6, style='italic', alpha=0.9,
+                             bbox=dict(boxstyle='round,pad=0.3', facecolor='white', edgecolor='none', alpha=0.5))
+    for avg_text, max_text, font_weight, font_size in zip(avg_texts, max_texts, font_weights, font_sizes):
+        avg_text.set_fontweight(font_weight)
+        avg_text.set_fontsize(font_size)
+        max_text.set_fontsize(font_size - 0.5)
+
     # Customize the chart
     ax.set_yticks(y_positions)
     ax.set_yticklabels(labels, fontsize=max(7, base_font_size))
@@ -692,7 +877,6 @@ def create_detailed_ancestry_chart(hierarchy: Dict[str, Any], num_relatives: int
                  fontsize=14, fontweight='bold', pad=20)
 
     # Add legend
-    from matplotlib.patches import Patch
     legend_elements = [
         Patch(facecolor='gray', alpha=0.8, label='Average'),
         Patch(facecolor='gray', alpha=0.4, label='Maximum')
@@ -709,19 +893,21 @@ def create_detailed_ancestry_chart(hierarchy: Dict[str, Any], num_relatives: int
     ax.set_ylim(-0.5, total_items - 0.5)
     ax.margins(y=0.01)  # Tight margins vertically
 
-    # Adjust layout to accommodate all labels with dynamic left margin
-    left_margin = min(0.35, max(0.25, 80 / fig.get_figwidth()))
-    plt.subplots_adjust(left=left_margin, right=0.96, top=0.97, bottom=0.05)
+    # Fit layout around all labels (replaces the slower bbox_inches='tight' on save)
+    chart_fig.tight_layout()
 
     # Save the chart
-    filename = f'{location_label.lower().replace(" ", "_")}_ancestry_complete_hierarchy.png'
-    plt.savefig(filename, dpi=300, bbox_inches='tight')
-    plt.close()
+    filename = f'{slug}_ancestry_complete_hierarchy.png'
+    chart_fig.savefig(filename, dpi=CHART_DPI)
+    if fig is None:
+        plt.close(chart_fig)
 
     return filename
 
 
-def calculate_average_ancestry(json_file_path: str, country_code: str, location_label: str) -> None:
+def calculate_average_ancestry(json_file_path: str, country_code: str, location_label: str,
+                               relatives_data: Optional[List[Dict[str, Any]]] = None,
+                               country_to_indices: Optional[Dict[str, List[int]]] = None) -> None:
     """
     Calculate and display average ancestry for relatives with all grandparents in specified location.
 
@@ -729,62 +915,56 @@ def calculate_average_ancestry(json_file_path: str, country_code: str, location_
         json_file_path: Path to the 23andMe matches JSON file
         country_code: Two-letter country code (e.g., 'PR', 'US', 'MX')
         location_label: Display name for the location (e.g., 'Puerto Rico', 'Mexico')
+        relatives_data: Already loaded relatives; the file is streamed when omitted
+        country_to_indices: Indices into relatives_data per country code, as returned
+            by analyze_grandparent_locations(); used together with relatives_data
     """
-    print("Loading 23andMe matches data...")
-
-    try:
-        with open(json_file_path, 'r', encoding='utf-8') as file:
-            relatives_data = json.load(file)
-    except FileNotFoundError:
-        print(f"Error: File not found at {json_file_path}")
-        return
-    except json.JSONDecodeError as e:
-        print(f"Error: Invalid JSON format - {e}")
-        return
+    # Filename prefix shared by the charts and the results file
+    slug = location_label.lower().replace(" ", "_")
 
-    print(f"Total relatives in dataset: {len(relatives_data)}")
-
-    # Filter relatives with all grandparents in specified location AND using latest compute
-    filtered_relatives = []
-    hierarchy_sums = defaultdict(lambda: defaultdict(float))
-    hierarchy_maxes = defaultdict(lambda: defaultdict(float))
-    total_filtered_relatives = 0
-    latest_compute_count = 0
-
-    for relative in relatives_data:
-        if has_all_grandparents_in_location(relative, country_code):
-            total_filtered_relatives += 1
-
-            # Check if using latest compute
-            ancestry_data = relative.get('ancestry', {})
-            using_latest_compute = ancestry_data.get(
-                'using_latest_compute', False)
-
-            if using_latest_compute:
-                latest_compute_count += 1
-                filtered_relatives.append(relative)
-
-                if ancestry_data:
-                    # Get hierarchical organization for this relative
-                    hierarchy = organize_ancestry_hierarchically(ancestry_data)
-
-                    # Add to running sums and track maximums for each level
-                    def sum_hierarchy(hier_dict, path=""):
-                        for region_name, data in hier_dict.items():
-                            percentage = data['percentage']
-                            hierarchy_sums[path][region_name] += percentage
-
-                            # Track maximum percentage for this region
-                            if percentage > hierarchy_maxes[path][region_name]:
-                                hierarchy_maxes[path][region_name] = percentage
+    if relatives_data is not None and country_to_indices is not None:
+        # Relatives were bucketed by country while analyzing locations
+        total_relatives = len(relatives_data)
+        location_relatives = [relatives_data[idx] for idx in country_to_indices.get(country_code, ())]
+    else:
+        if relatives_data is None:
+            print("Loading 23andMe matches data...")
+            relatives_data = iter_relatives(json_file_path)
 
-                            # Recursively sum children
-                            children = data.get('children', {})
-                            if children:
-                                new_path = f"{path}/{region_name}" if path else region_name
-                                sum_hierarchy(children, new_path)
+        # Only keep relatives with all grandparents in the location
+        target_countries = (country_code,) * len(GRANDPARENT_KEYS)
+        location_relatives = []
+        total_relatives = 0
 
-                    sum_hierarchy(hierarchy)
+        try:
+            for relative in relatives_data:
+                total_relatives += 1
+                if grandparent_countries(relative) == target_countries:
+                    location_relatives.append(relative)
+        except FileNotFoundError:
+            print(f"Error: File not found at {json_file_path}")
+            return
+        except JSON_ERRORS as e:
+            print(f"Error: Invalid JSON format - {e}")
+            return
+
+    print(f"Total relatives in dataset: {total_relatives}")
+
+    total_filtered_relatives = len(location_relatives)
+
+    # Filter relatives using latest compute
+    filtered_relatives = [relative for relative in location_relatives
+                          if (relative.get('ancestry') or _EMPTY).get('using_latest_compute')]
+
+    # Flat per-region tables indexed by region id
+    regions = RegionTable()
+    # Scratch lists reused for every relative's flattened regions
+    scratch = ([], [])
+
+    for relative in filtered_relatives:
+        # Flatten this relative's regions and add to running sums
+        ids, percentages = walk_ancestry(relative['ancestry'], regions, scratch)
+        accumulate_regions(ids, percentages, regions.sums, regions.maxes)
 
     print(
         f"Relatives with all 4 grandparents born in {country_code}: {total_filtered_relatives}")
@@ -806,52 +986,21 @@ def calculate_average_ancestry(json_file_path: str, country_code: str, location_
     output_lines.append("="*60)
 
     # Build average hierarchy with maximums
-    average_hierarchy = {}
-
-    # Calculate averages and maximums for main categories (level 0)
-    for region_name, total_sum in hierarchy_sums[""].items():
-        avg_percentage = total_sum / len(filtered_relatives)
-        max_percentage = hierarchy_maxes[""][region_name]
-        average_hierarchy[region_name] = {
-            'percentage': avg_percentage,
-            'max_percentage': max_percentage,
-            'children': {}
-        }
-
-        # Calculate averages and maximums for sub-categories
-        if region_name in hierarchy_sums:
-            for sub_region, sub_total in hierarchy_sums[region_name].items():
-                sub_avg = sub_total / len(filtered_relatives)
-                sub_max = hierarchy_maxes[region_name][sub_region]
-                average_hierarchy[region_name]['children'][sub_region] = {
-                    'percentage': sub_avg,
-                    'max_percentage': sub_max,
-                    'children': {}
-                }
-
-                # Calculate averages and maximums for sub-sub-categories
-                sub_path = f"{region_name}/{sub_region}"
-                if sub_path in hierarchy_sums:
-                    for subsub_region, subsub_total in hierarchy_sums[sub_path].items():
-                        subsub_avg = subsub_total / len(filtered_relatives)
-                        subsub_max = hierarchy_maxes[sub_path][subsub_region]
-                        average_hierarchy[region_name]['children'][sub_region]['children'][subsub_region] = {
-                            'percentage': subsub_avg,
-                            'max_percentage': subsub_max,
-                            'children': {}
-                        }
+    average_hierarchy = build_average_hierarchy(regions, len(filtered_relatives))
 
     header_text = f"\nBased on {len(filtered_relatives)} relatives with all grandparents born in {country_code} and using latest compute:\n"
     print(header_text)
     output_lines.append(header_text)
 
     # Display hierarchical ancestry
-    hierarchy_lines = display_hierarchy(average_hierarchy, 0, [])
-    output_lines.extend(hierarchy_lines)
+    hierarchy_start = len(output_lines)
+    display_hierarchy(average_hierarchy, output_lines)
+    if len(output_lines) > hierarchy_start:
+        sys.stdout.write('\n'.join(output_lines[hierarchy_start:]) + '\n')
 
     # Calculate total percentage from main categories
-    total_percentage = sum(data['percentage']
-                           for data in average_hierarchy.values())
+    total_percentage = sum(percentage for percentage, level in zip(average_hierarchy.avg, average_hierarchy.level)
+                           if level == 0)
 
     # Add summary
     print(f"\n" + "-"*60)
@@ -876,24 +1025,31 @@ def calculate_average_ancestry(json_file_path: str, country_code: str, location_
     print("GENERATING ANCESTRY VISUALIZATIONS")
     print("="*60)
 
+    chart_fig = None
+
     try:
-        # Build color mapping from actual 23andMe data
-        color_mapping = build_color_mapping(filtered_relatives)
+        # Map region names to their actual 23andMe colors
+        color_mapping = dict(zip(regions.names, regions.colors))
+
+        # One figure is cleared and reused for every chart
+        plt = import_pyplot()
+        chart_fig = plt.figure()
 
         # Create main categories bar chart
         main_chart_file = create_main_categories_bar_chart(
-            average_hierarchy, len(filtered_relatives), color_mapping, location_label)
+            average_hierarchy, len(filtered_relatives), color_mapping, location_label, slug, chart_fig)
         print(f"✓ Main categories chart saved: {main_chart_file}")
 
         # Create detailed breakdown chart
         detailed_chart_file = create_detailed_ancestry_chart(
-            average_hierarchy, len(filtered_relatives), color_mapping, location_label)
+            average_hierarchy, len(filtered_relatives), color_mapping, location_label, slug, chart_fig)
         print(f"✓ Detailed breakdown chart saved: {detailed_chart_file}")
 
         # Create haplogroup charts
-        haplogroup_chart_files = create_haplogroup_charts(haplogroup_data, location_label)
-        for chart_file in haplogroup_chart_files:
-            print(f"✓ Haplogroup chart saved: {chart_file}")
+        haplogroup_chart_files = create_haplogroup_charts(haplogroup_data, location_label, slug, chart_fig)
+        if haplogroup_chart_files:
+            sys.stdout.write(''.join(f"✓ Haplogroup chart saved: {chart_file}\n"
+                                     for chart_file in haplogroup_chart_files))
 
         output_lines.append(f"\n" + "="*60)
         output_lines.append("CHARTS GENERATED:")
@@ -910,6 +1066,9 @@ def calculate_average_ancestry(json_file_path: str, country_code: str, location_
         error_msg = f"✗ Error creating charts: {e}"
         print(error_msg)
         output_lines.append(f"\n{error_msg}")
+    finally:
+        if chart_fig is not None:
+            plt.close(chart_fig)
 
     # Display haplogroup analysis
     display_haplogroup_analysis(
@@ -923,22 +1082,22 @@ def calculate_average_ancestry(json_file_path: str, country_code: str, location_
     output_lines.append("RELATIVE DETAILS:")
     output_lines.append("-"*60)
 
+    detail_lines = []
     for i, relative in enumerate(filtered_relatives[:10], 1):  # Show first 10
         initials = relative.get('initials', 'N/A')
-        relationship = relative.get(
-            'predicted_relationship_id', 'Unknown').replace('_', ' ').title()
+        relationship = format_relationship(relative.get('predicted_relationship_id', 'Unknown'))
         ibd = relative.get('ibd_proportion', 0) * 100
-        line = f"{i:2d}. {initials:<4} - {relationship:<25} (IBD: {ibd:.1f}%)"
-        print(line)
-        output_lines.append(line)
+        detail_lines.append(f"{i:2d}. {initials:<4} - {relationship:<25} (IBD: {ibd:.1f}%)")
 
     if len(filtered_relatives) > 10:
-        line = f"... and {len(filtered_relatives) - 10} more relatives"
-        print(line)
-        output_lines.append(line)
+        detail_lines.append(f"... and {len(filtered_relatives) - 10} more relatives")
+
+    # Write the details to stdout in one call
+    sys.stdout.write('\n'.join(detail_lines) + '\n')
+    output_lines.extend(detail_lines)
 
     # Save results to text file
-    output_file = f"{location_label.lower().replace(' ', '_')}_ancestry_hierarchical_results.txt"
+    output_file = f"{slug}_ancestry_hierarchical_results.txt"
     try:
         with open(output_file, 'w', encoding='utf-8') as f:
             f.write('\n'.join(output_lines))
@@ -948,8 +1107,10 @@ def calculate_average_ancestry(json_file_path: str, country_code: str, location_
 
 
 def get_json_files_in_directory():
-    """Get list of JSON files in the current directory."""
-    return [f for f in os.listdir('.') if f.endswith('.json')]
+    """Get list of (filename, size in bytes) for JSON files in the current directory."""
+    with os.scandir('.') as entries:
+        return [(entry.name, entry.stat().st_size) for entry in entries
+                if entry.name.endswith('.json') and entry.is_file()]
 
 
 def select_json_file():
@@ -967,8 +1128,7 @@ def select_json_file():
 
     print("\nAvailable JSON files:")
     print("=" * 50)
-    for i, filename in enumerate(json_files, 1):
-        file_size = os.path.getsize(filename)
+    for i, (filename, file_size) in enumerate(json_files, 1):
         size_kb = file_size / 1024
         print(f"{i}. {filename} ({size_kb:.1f} KB)")
 
@@ -980,7 +1140,7 @@ def select_json_file():
             choice_num = int(choice)
 
             if 1 <= choice_num <= len(json_files):
-                return json_files[choice_num - 1]
+                return json_files[choice_num - 1][0]
             elif choice_num == len(json_files) + 1:
                 manual_path = input("Enter the full path to your JSON file: ").strip()
                 if os.path.exists(manual_path):
@@ -1002,40 +1162,37 @@ def analyze_grandparent_locations(relatives_data):
     Analyze all grandparent locations in the dataset and count matches.
 
     Args:
-        relatives_data: List of relative dictionaries from JSON
+        relatives_data: Relative dictionaries from JSON (a list or a stream)
 
     Returns:
-        Dict mapping country codes to match counts and location names
+        Tuple of (location_counts, location_names, country_to_indices), where
+        country_to_indices maps each country code to the positions of its
+        relatives in relatives_data
     """
-    from collections import Counter
-
     location_counts = Counter()
     location_names = {}  # Store full location names
+    country_to_indices = defaultdict(list)
 
-    for relative in relatives_data:
-        gp_locations = relative.get('grandparent_birth_locations', {})
-        required_gps = ['maternal_gma', 'maternal_gpa', 'paternal_gma', 'paternal_gpa']
-
+    for idx, relative in enumerate(relatives_data):
         # Check if all 4 grandparents exist
-        all_gps_present = all(gp in gp_locations and gp_locations[gp] for gp in required_gps)
-
-        if all_gps_present:
-            # Get all country codes
-            countries = [gp_locations[gp].get('country') for gp in required_gps]
+        countries = grandparent_countries(relative)
+        if countries is None:
+            continue
 
-            # Check if all 4 are the same
-            if len(set(countries)) == 1 and countries[0]:
-                country_code = countries[0]
-                location_counts[country_code] += 1
+        # Check if all 4 are the same
+        country_code, maternal_gpa, paternal_gma, paternal_gpa = countries
+        if country_code and country_code == maternal_gpa == paternal_gma == paternal_gpa:
+            location_counts[country_code] += 1
+            country_to_indices[country_code].append(idx)
 
-                # Try to get full location name from first grandparent
-                if country_code not in location_names:
-                    gp_info = gp_locations[required_gps[0]]
-                    # Try to get location name (city, state, or country name)
-                    location_name = gp_info.get('location', country_code)
-                    location_names[country_code] = location_name
+            # Try to get full location name from first grandparent
+            if country_code not in location_names:
+                gp_info = relative['grandparent_birth_locations'][GRANDPARENT_KEYS[0]]
+                # Try to get location name (city, state, or country name)
+                location_name = gp_info.get('location', country_code)
+                location_names[country_code] = location_name
 
-    return location_counts, location_names
+    return location_counts, location_names, country_to_indices
 
 
 def get_location_input(relatives_data):
@@ -1043,17 +1200,17 @@ def get_location_input(relatives_data):
     Get country code and location label from user based on available data.
 
     Args:
-        relatives_data: List of relative dictionaries from JSON
+        relatives_data: Relative dictionaries from JSON (a list or a stream)
 
     Returns:
-        Tuple of (country_code, location_label)
+        Tuple of (country_code, location_label, country_to_indices)
     """
     print("\n" + "=" * 50)
     print("GRANDPARENT LOCATION FILTER")
     print("=" * 50)
     print("\nAnalyzing grandparent locations in your data...")
 
-    location_counts, location_names = analyze_grandparent_locations(relatives_data)
+    location_counts, location_names, country_to_indices = analyze_grandparent_locations(relatives_data)
 
     if not location_counts:
         print("\nNo relatives found with all 4 grandparents from the same location.")
@@ -1061,7 +1218,7 @@ def get_location_input(relatives_data):
         sys.exit(1)
 
     # Sort by count (descending)
-    sorted_locations = sorted(location_counts.items(), key=lambda x: x[1], reverse=True)
+    sorted_locations = location_counts.most_common()
 
     print(f"\nFound relatives with all 4 grandparents from these locations:")
     print("-" * 50)
@@ -1085,7 +1242,7 @@ def get_location_input(relatives_data):
                 custom = input(f"Display name [{default_label}]: ").strip()
                 location_label = custom if custom else default_label
 
-                return country_code, location_label
+                return country_code, location_label, country_to_indices
 
             elif choice_num == len(sorted_locations) + 1:
                 country_code = input("Enter country code (2 letters): ").strip().upper()
@@ -1093,7 +1250,7 @@ def get_location_input(relatives_data):
                     location_label = input("Display name for location: ").strip()
                     if not location_label:
                         location_label = country_code
-                    return country_code, location_label
+                    return country_code, location_label, country_to_indices
                 else:
                     print("Please enter a valid 2-letter country code")
                     continue
@@ -1118,21 +1275,28 @@ if __name__ == "__main__":
     # Load the JSON data
     print("\nLoading JSON data...")
     try:
-        with open(json_file, 'r', encoding='utf-8') as file:
-            relatives_data = json.load(file)
-        print(f"Loaded {len(relatives_data)} relatives from file")
+        if ijson is not None:
+            # Stream the file instead of holding every relative in memory:
+            # once here to list locations, and once more for the analysis
+            relatives_data = None
+            country_code, location_label, _ = get_location_input(iter_relatives(json_file))
+            country_to_indices = None
+        else:
+            relatives_data = load_relatives(json_file)
+            print(f"Loaded {len(relatives_data)} relatives from file")
+
+            # Get location filter based on the actual data
+            country_code, location_label, country_to_indices = get_location_input(relatives_data)
     except FileNotFoundError:
         print(f"Error: File not found at {json_file}")
         sys.exit(1)
-    except json.JSONDecodeError as e:
+    except JSON_ERRORS as e:
         print(f"Error: Invalid JSON format - {e}")
         sys.exit(1)
 
-    # Get location filter based on the actual data
-    country_code, location_label = get_location_input(relatives_data)
-
     print(f"\nFiltering for relatives with all 4 grandparents born in {country_code} ({location_label})")
     print("=" * 50)
 
     # Run the analysis
-    calculate_average_ancestry(json_file, country_code, location_label)
+    calculate_average_ancestry(json_file, country_code, location_label,
+                               relatives_data, country_to_indices)